@@ -5,7 +5,10 @@ __author__ = ["viktorkaz", "mloning"]
 
 import logging
 
+import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.sparse import csr_matrix
 from sklearn.base import clone
 
 from sktime.benchmarking.tasks import TSCTask, TSRTask
@@ -16,9 +19,26 @@ log.addHandler(console)
 
 
 class Orchestrator:
-    """Fit and predict one or more estimators on one or more datasets."""
-
-    def __init__(self, tasks, datasets, strategies, cv, results):
+    """Fit and predict one or more estimators on one or more datasets.
+
+    Parameters
+    ----------
+    tasks : list of sktime tasks
+        One task for each dataset.
+    datasets : list of sktime datasets
+        Datasets to fit and predict on.
+    strategies : list of sktime strategies
+        Strategies to fit and predict.
+    cv : cross-validation generator
+        Splits each dataset into training and test sets.
+    results : sktime results object
+        Backend to save the results to.
+    n_jobs : int, optional (default=1)
+        The number of jobs to run in parallel in `fit_predict`, one job per
+        strategy and CV-fold. ``-1`` means using all processors.
+    """
+
+    def __init__(self, tasks, datasets, strategies, cv, results, n_jobs=1):
         # validate datasets and tasks
         self._validate_tasks_and_datasets(tasks, datasets)
         self.tasks = tasks
@@ -30,6 +50,7 @@ class Orchestrator:
 
         self.cv = cv
         self.results = results
+        self.n_jobs = n_jobs
 
         # attach cv iterator to results object
         self.results.cv = cv
@@ -40,8 +61,13 @@ class Orchestrator:
         self._strategy_counter = 0
         self._dataset_counter = 0
 
-    def _iter(self):
+    def _iter(self, slice_test=True):
         """Orchestration iterator."""
+        for task, dataset, data in self._iter_datasets():
+            yield from self._iter_folds(task, dataset, data, slice_test)
+
+    def _iter_datasets(self):
+        """Iterate over tasks and loaded datasets."""
         # TODO: check if datasets are skipped entirely because predictions
         #  already exists before loading data,
         #  maybe do a dry-run first to find out which datasets to skip?
@@ -51,20 +77,37 @@ class Orchestrator:
             self._dataset_counter += 1
 
             # load data into memory from dataset hook
-            data = dataset.load()
-
-            # get target in case stratified cross-validation is used
-            y = data[task.target]
-
-            for strategy in self.strategies:
-                self._strategy_counter += 1  # update counter
+            yield task, dataset, dataset.load()
 
-                for cv_fold, (train_idx, test_idx) in enumerate(self.cv.split(data, y)):
-                    # for each fold, clone strategy to avoid updating
-                    # already fitted strategies
-                    strategy = clone(strategy)
+    def _iter_folds(self, task, dataset, data, slice_test=True):
+        """Iterate over strategies and CV-folds of one dataset."""
+        # get target in case stratified cross-validation is used
+        y = data[task.target]
 
-                    yield (task, dataset, data, strategy, cv_fold, train_idx, test_idx)
+        for cv_fold, (train_idx, test_idx) in enumerate(self.cv.split(data, y)):
+            # split data into training and test sets once per fold, and
+            # share the split across all strategies
+            train = data.iloc[train_idx]
+            test = data.iloc[test_idx] if slice_test else None
+
+            for i, strategy in enumerate(self.strategies):
+                self._strategy_counter = i + 1  # update counter
+
+                # for each fold, clone strategy to avoid updating
+                # already fitted strategies
+                strategy = clone(strategy)
+
+                yield (
+                    task,
+                    dataset,
+                    data,
+                    strategy,
+                    cv_fold,
+                    train_idx,
+                    test_idx,
+                    train,
+                    test,
+                )
 
     def fit(self, overwrite_fitted_strategies=False, verbose=False):
         """Fit strategies on datasets."""
@@ -74,9 +117,11 @@ class Orchestrator:
             data,
             strategy,
             cv_fold,
-            train_idx,
+            _train_idx,
             _test_idx,
-        ) in self._iter():
+            train,
+            _test,
+        ) in self._iter(slice_test=False):
 
             # skip strategy, if overwrite is set to False and fitted
             # strategy already exists
@@ -94,7 +139,6 @@ class Orchestrator:
 
             # else fit and save fitted strategy
             else:
-                train = data.iloc[train_idx]
                 self._print_progress(
                     dataset.name, strategy.name, cv_fold, "train", "fit", verbose
                 )
@@ -132,8 +176,68 @@ class Orchestrator:
                 f"{save_fitted_strategies}"
             )
 
-        # fitting and prediction
-        for task, dataset, data, strategy, cv_fold, train_idx, test_idx in self._iter():
+        # fitting and prediction, one dataset at a time. The (strategy, fold)
+        # jobs of a dataset are independent and run in parallel, their
+        # results are returned to and saved by the main process, so that
+        # results backends need not be process-safe and an interrupted run
+        # can be resumed. Jobs are generated lazily, so that only the folds
+        # of dispatched jobs are held in memory.
+        with Parallel(n_jobs=self.n_jobs, prefer="processes") as parallel:
+            for task, dataset, data in self._iter_datasets():
+                jobs = self._iter_fit_predict_jobs(
+                    task,
+                    dataset,
+                    data,
+                    overwrite_predictions,
+                    predict_on_train,
+                    save_fitted_strategies,
+                    overwrite_fitted_strategies,
+                    verbose,
+                )
+
+                # without parallelism, save the results of each job as soon
+                # as it is done
+                if effective_n_jobs(self.n_jobs) == 1:
+                    fitted = (func(*args, **kwargs) for func, args, kwargs in jobs)
+                else:
+                    fitted = parallel(jobs)
+
+                for dataset_name, cv_fold, strategy, predictions in fitted:
+                    if strategy is not None:
+                        self.results.save_fitted_strategy(
+                            strategy, dataset_name=dataset_name, cv_fold=cv_fold
+                        )
+                    for prediction in predictions:
+                        self.results.save_predictions(
+                            dataset_name=dataset_name, cv_fold=cv_fold, **prediction
+                        )
+
+        # save results as master file
+        self.results.save()
+
+    def _iter_fit_predict_jobs(
+        self,
+        task,
+        dataset,
+        data,
+        overwrite_predictions,
+        predict_on_train,
+        save_fitted_strategies,
+        overwrite_fitted_strategies,
+        verbose,
+    ):
+        """Iterate over fit and predict jobs of one dataset."""
+        for (
+            _task,
+            _dataset,
+            _data,
+            strategy,
+            cv_fold,
+            train_idx,
+            test_idx,
+            train,
+            test,
+        ) in self._iter_folds(task, dataset, data):
 
             # check which results already exist
             train_pred_exist = self.results.check_predictions_exist(
@@ -161,82 +265,104 @@ class Orchestrator:
                 )
                 continue
 
-            # split data into training and test sets
-            train = data.iloc[train_idx]
-            test = data.iloc[test_idx]
-
-            # fit strategy
-            self._print_progress(
-                dataset.name, strategy.name, cv_fold, "train", "fit", verbose
-            )
-            fit_estimator_start_time = pd.Timestamp.now()
-            strategy.fit(task, train)
-            fit_estimator_end_time = pd.Timestamp.now()
-
-            # save fitted strategy if save fitted strategies is set to True
-            # and overwrite is set to True or the
-            # fitted strategy does not already exist
-            if save_fitted_strategies and (
-                overwrite_fitted_strategies or not fitted_stategy_exists
-            ):
-                self.results.save_fitted_strategy(
-                    strategy, dataset_name=dataset.name, cv_fold=cv_fold
+            yield delayed(self._fit_predict_one)(
+                dataset.name,
+                cv_fold,
+                task,
+                strategy,
+                train_idx,
+                test_idx,
+                train,
+                test,
+                # save fitted strategy if save fitted strategies is set to
+                # True and overwrite is set to True or the fitted strategy
+                # does not already exist
+                save_fitted_strategies
+                and (overwrite_fitted_strategies or not fitted_stategy_exists),
+                # optionally, predict on training set if predict on train
+                # is set to True and and overwrite is set to True or the
+                # predicted values do not already exist
+                predict_on_train and (overwrite_predictions or not train_pred_exist),
+                # predict on test set if overwrite predictions is set to
+                # True or predictions do not already exist
+                overwrite_predictions or not test_pred_exist,
+                # progress is printed by the job when fitting starts
+                self._format_progress(
+                    dataset.name, strategy.name, cv_fold, "train", "fit"
                 )
+                if verbose
+                else None,
+            )
 
-            # optionally, predict on training set if predict on train is set
-            # to True and and overwrite is set to True
-            # or the predicted values do not already exist
-            if predict_on_train and (overwrite_predictions or not train_pred_exist):
-                y_true = train.loc[:, task.target]
-                predict_estimator_start_time = pd.Timestamp.now()
-                y_pred = strategy.predict(train)
-                predict_estimator_end_time = pd.Timestamp.now()
-
-                y_proba = self._predict_proba_one(strategy, task, train, y_true, y_pred)
-                self.results.save_predictions(
-                    strategy_name=strategy.name,
-                    dataset_name=dataset.name,
-                    index=train_idx,
-                    y_true=y_true,
-                    y_pred=y_pred,
-                    y_proba=y_proba,
-                    cv_fold=cv_fold,
-                    fit_estimator_start_time=fit_estimator_start_time,
-                    fit_estimator_end_time=fit_estimator_end_time,
-                    predict_estimator_start_time=predict_estimator_start_time,
-                    predict_estimator_end_time=predict_estimator_end_time,
-                    train_or_test="train",
-                )
+    @staticmethod
+    def _fit_predict_one(
+        dataset_name,
+        cv_fold,
+        task,
+        strategy,
+        train_idx,
+        test_idx,
+        train,
+        test,
+        return_strategy,
+        predict_on_train,
+        predict_on_test,
+        progress,
+    ):
+        """Fit and predict strategy on one CV-fold."""
+        if progress is not None:
+            log.warn(progress)
+
+        # fit strategy
+        fit_estimator_start_time = pd.Timestamp.now()
+        strategy.fit(task, train)
+        fit_estimator_end_time = pd.Timestamp.now()
+
+        # fix the classes once per fold, so that one-hot encoded predictions
+        # on training and test set share the same columns
+        classes = np.unique(train[task.target]) if isinstance(task, TSCTask) else None
+
+        predictions = []
+        for train_or_test, index, data, predict in (
+            ("train", train_idx, train, predict_on_train),
+            ("test", test_idx, test, predict_on_test),
+        ):
+            if not predict:
+                continue
 
-            # predict on test set if overwrite predictions is set to True or
-            # predictions do not already exist
-            if overwrite_predictions or not test_pred_exist:
-                y_true = test.loc[:, task.target]
-                predict_estimator_start_time = pd.Timestamp.now()
-                y_pred = strategy.predict(test)
-                predict_estimator_end_time = pd.Timestamp.now()
-
-                y_proba = self._predict_proba_one(strategy, task, test, y_true, y_pred)
-                self.results.save_predictions(
-                    dataset_name=dataset.name,
+            # pass a plain array rather than a copied Series to results
+            y_true = data[task.target].to_numpy()
+            predict_estimator_start_time = pd.Timestamp.now()
+            y_pred = strategy.predict(data)
+            predict_estimator_end_time = pd.Timestamp.now()
+
+            y_proba = Orchestrator._predict_proba_one(
+                strategy, task, data, y_pred, classes
+            )
+            predictions.append(
+                dict(
                     strategy_name=strategy.name,
-                    index=test_idx,
+                    index=index,
                     y_true=y_true,
                     y_pred=y_pred,
                     y_proba=y_proba,
-                    cv_fold=cv_fold,
                     fit_estimator_start_time=fit_estimator_start_time,
                     fit_estimator_end_time=fit_estimator_end_time,
                     predict_estimator_start_time=predict_estimator_start_time,
                     predict_estimator_end_time=predict_estimator_end_time,
-                    train_or_test="test",
+                    train_or_test=train_or_test,
                 )
+            )
 
-        # save results as master file
-        self.results.save()
+        return (
+            dataset_name,
+            cv_fold,
+            strategy if return_strategy else None,
+            predictions,
+        )
 
     @staticmethod
-    def _predict_proba_one(strategy, task, data, y_true, y_pred):
+    def _predict_proba_one(strategy, task, data, y_pred, classes):
         """Predict strategy on one dataset."""
         # TODO always try to get probabilistic predictions first, compute
         #  deterministic predictions using
@@ -249,15 +375,26 @@ class Orchestrator:
         if isinstance(task, TSCTask) and hasattr(strategy, "predict_proba"):
             return strategy.predict_proba(data)
 
-            # otherwise, return deterministic predictions in expected format
-            # else:
-            #     n_class_true = len(np.unique(y_true))
-            #     n_class_pred = len(np.unique(y_pred))
-            #     n_classes = np.maximum(n_class_pred, n_class_true)
-            #     n_predictions = len(y_pred)
-            #     y_proba = (n_predictions, n_classes)
-            #     y_proba = np.zeros(y_proba)
-            #     y_proba[:, np.array(y_pred, dtype=int)] = 1
+        # otherwise, return deterministic predictions in expected format,
+        # one-hot encoded over the classes of the training set as a sparse
+        # matrix to avoid allocating a dense n_predictions x n_classes array
+        elif isinstance(task, TSCTask):
+            y_pred = np.asarray(y_pred)
+            n_predictions = len(y_pred)
+
+            # predicted labels which are not among the training classes
+            # cannot be one-hot encoded
+            cols = pd.Index(classes).get_indexer(y_pred)
+            if (cols < 0).any():
+                return None
+
+            return csr_matrix(
+                (
+                    np.ones(n_predictions, dtype=np.float32),
+                    (np.arange(n_predictions), cols),
+                ),
+                shape=(n_predictions, len(classes)),
+            )
 
         else:
             return None
@@ -331,18 +468,33 @@ class Orchestrator:
     ):
         """Print progress."""
         if verbose:
-            fit_or_predict = fit_or_predict.capitalize()
-            if train_or_test == "train" and fit_or_predict == "predict":
-                on_train = " (training set)"
-            else:
-                on_train = ""
-
-            n_splits = self.cv.get_n_splits() - 1  # zero indexing
-
             log.warn(
-                f"strategy: {self._strategy_counter}/{self.n_strategies} - "
-                f"{strategy_name} "
-                f"on CV-fold: {cv_fold}/{n_splits} "
-                f"of dataset: {self._dataset_counter}/{self.n_datasets} - "
-                f"{dataset_name}{on_train}"
+                self._format_progress(
+                    dataset_name, strategy_name, cv_fold, train_or_test, fit_or_predict
+                )
             )
+
+    def _format_progress(
+        self,
+        dataset_name,
+        strategy_name,
+        cv_fold,
+        train_or_test,
+        fit_or_predict,
+    ):
+        """Format progress message."""
+        fit_or_predict = fit_or_predict.capitalize()
+        if train_or_test == "train" and fit_or_predict == "predict":
+            on_train = " (training set)"
+        else:
+            on_train = ""
+
+        n_splits = self.cv.get_n_splits() - 1  # zero indexing
+
+        return (
+            f"strategy: {self._strategy_counter}/{self.n_strategies} - "
+            f"{strategy_name} "
+            f"on CV-fold: {cv_fold}/{n_splits} "
+            f"of dataset: {self._dataset_counter}/{self.n_datasets} - "
+            f"{dataset_name}{on_train}"
+        )
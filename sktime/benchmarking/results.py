@@ -7,9 +7,9 @@ import os
 import numpy as np
 import pandas as pd
 from joblib import load
-from sktime.benchmarking.base import BaseResults
-from sktime.benchmarking.base import HDDBaseResults
-from sktime.benchmarking.base import _PredictionsWrapper
+from scipy.sparse import issparse
+
+from sktime.benchmarking.base import BaseResults, HDDBaseResults, _PredictionsWrapper
 
 
 class RAMResults(BaseResults):
@@ -45,7 +45,7 @@ class RAMResults(BaseResults):
             array with true labels
         y_pred : numpy array
             array of predicted labels
-        y_proba : numpy array
+        y_proba : numpy array or scipy sparse matrix
             array of probabilities associated with the predicted values
         index : numpy array
             dataset indeces of the y_true data points
@@ -63,7 +63,9 @@ class RAMResults(BaseResults):
         index = np.asarray(index)
         y_true = np.asarray(y_true)
         y_pred = np.asarray(y_pred)
-        y_proba = np.asarray(y_proba)
+        # keep sparse (one-hot) probabilities sparse
+        if not issparse(y_proba):
+            y_proba = np.asarray(y_proba)
         self.results[key] = _PredictionsWrapper(
             strategy_name,
             dataset_name,
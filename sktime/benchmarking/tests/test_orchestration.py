@@ -6,6 +6,7 @@ import os
 
 import numpy as np
 import pytest
+from scipy.sparse import issparse
 from sklearn.dummy import DummyClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, f1_score, make_scorer
@@ -81,6 +82,118 @@ def test_automated_orchestration_vs_manual(data_loader):
     np.testing.assert_array_equal(actual, expected)
 
 
+def test_one_hot_probas_for_deterministic_strategies():
+    """Test one-hot probabilities for strategies without predict_proba."""
+    data = load_gunpoint(return_X_y=False)
+    dataset = RAMDataset(dataset=data, name="data")
+    task = TSCTask(target="class_val")
+    clf = make_reduction_pipeline(
+        RandomForestClassifier(n_estimators=2, random_state=1)
+    )
+    strategy = TSCStrategy(clf)
+
+    results = RAMResults()
+    orchestrator = Orchestrator(
+        datasets=[dataset],
+        tasks=[task],
+        strategies=[strategy],
+        cv=SingleSplit(random_state=1),
+        results=results,
+    )
+    orchestrator.fit_predict(save_fitted_strategies=False, predict_on_train=True)
+
+    # columns are the classes of the training set, for both train and test
+    train = next(results.load_predictions(cv_fold=0, train_or_test="train"))
+    classes = np.unique(train.y_true)
+    for train_or_test in ["train", "test"]:
+        result = next(results.load_predictions(cv_fold=0, train_or_test=train_or_test))
+        assert issparse(result.y_proba)
+        y_proba = result.y_proba.toarray()
+        assert y_proba.shape == (len(result.y_pred), len(classes))
+        np.testing.assert_array_equal(y_proba.sum(axis=1), 1)
+        np.testing.assert_array_equal(classes[y_proba.argmax(axis=1)], result.y_pred)
+
+
+@pytest.mark.parametrize(
+    "y_pred", [np.array(["1", "3"]), np.array(["1", "0"]), np.array([1, 2])]
+)
+def test_no_one_hot_probas_for_unknown_classes(y_pred):
+    """Test no one-hot probabilities for labels not among training classes."""
+    task = TSCTask(target="class_val")
+    classes = np.array(["1", "2"])
+    # object() has no predict_proba, the predictions are one-hot encoded
+    y_proba = Orchestrator._predict_proba_one(object(), task, None, y_pred, classes)
+    assert y_proba is None
+
+
+def test_parallel_orchestration():
+    """Test parallel orchestration gives the same results as serial one."""
+    data = load_gunpoint(return_X_y=False)
+    dataset = RAMDataset(dataset=data, name="data")
+    task = TSCTask(target="class_val")
+    clf = make_reduction_pipeline(
+        RandomForestClassifier(n_estimators=2, random_state=1)
+    )
+    strategy = TSCStrategy(clf)
+    cv = StratifiedKFold(n_splits=3, random_state=1, shuffle=True)
+
+    predictions = []
+    for n_jobs in [1, 2]:
+        results = RAMResults()
+        orchestrator = Orchestrator(
+            datasets=[dataset],
+            tasks=[task],
+            strategies=[strategy],
+            cv=cv,
+            results=results,
+            n_jobs=n_jobs,
+        )
+        orchestrator.fit_predict(save_fitted_strategies=False, predict_on_train=True)
+        predictions.append(
+            [
+                next(results.load_predictions(cv_fold=cv_fold, train_or_test="test"))
+                for cv_fold in range(cv.get_n_splits())
+            ]
+        )
+
+    for serial, parallel in zip(*predictions):
+        np.testing.assert_array_equal(serial.index, parallel.index)
+        np.testing.assert_array_equal(serial.y_pred, parallel.y_pred)
+        np.testing.assert_array_equal(
+            serial.y_proba.toarray(), parallel.y_proba.toarray()
+        )
+
+
+def test_results_saved_per_dataset():
+    """Test results of finished datasets are saved if a later dataset fails."""
+    data = load_gunpoint(return_X_y=False)
+    datasets = [
+        RAMDataset(dataset=data, name="data"),
+        RAMDataset(dataset=data, name="broken"),
+    ]
+    # the target of the second task does not exist in the data
+    tasks = [TSCTask(target="class_val"), TSCTask(target="missing")]
+    clf = make_reduction_pipeline(
+        RandomForestClassifier(n_estimators=2, random_state=1)
+    )
+    strategy = TSCStrategy(clf)
+
+    results = RAMResults()
+    orchestrator = Orchestrator(
+        datasets=datasets,
+        tasks=tasks,
+        strategies=[strategy],
+        cv=SingleSplit(random_state=1),
+        results=results,
+        n_jobs=2,
+    )
+    with pytest.raises(KeyError):
+        orchestrator.fit_predict(save_fitted_strategies=False)
+
+    result = next(results.load_predictions(cv_fold=0, train_or_test="test"))
+    assert result.dataset_name == "data"
+
+
 # extensive tests of orchestration and metric evaluation against sklearn
 @pytest.mark.parametrize(
     "dataset",
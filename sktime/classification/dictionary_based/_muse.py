@@ -10,13 +10,14 @@ __all__ = ["MUSE"]
 
 import math
 import warnings
+from itertools import chain
 
 import numpy as np
 from numba import njit
+from scipy.sparse import coo_matrix
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.feature_selection import chi2
 from sklearn.linear_model import LogisticRegression
-from sklearn.pipeline import make_pipeline
 from sklearn.utils import check_random_state
 
 from sktime.classification.base import BaseClassifier
@@ -240,7 +241,6 @@ class MUSE(BaseClassifier):
                 bag = sfa_words[0]
 
                 # chi-squared test to keep only relevant features
-                relevant_features = {}
                 apply_chi_squared = self.p_threshold < 1
                 if apply_chi_squared:
                     vectorizer = DictVectorizer(sparse=True, dtype=np.int32, sort=False)
@@ -248,44 +248,59 @@ class MUSE(BaseClassifier):
 
                     chi2_statistics, p = chi2(bag_vec, y)
                     relevant_features_idx = np.where(p <= self.p_threshold)[0]
-                    relevant_features = set(
-                        np.array(vectorizer.feature_names_)[relevant_features_idx]
+
+                    # SFA words are integers, read them into an int64 array
+                    # rather than boxing them into an object array
+                    feature_names = np.fromiter(
+                        vectorizer.feature_names_,
+                        dtype=np.int64,
+                        count=len(vectorizer.feature_names_),
                     )
+                    relevant_features = feature_names[relevant_features_idx]
 
                 # merging bag-of-patterns of different window_sizes
                 # to single bag-of-patterns with prefix indicating
                 # the used window-length
                 highest = np.int32(self.highest_bits[ind])
-                for j in range(len(bag)):
-                    for (key, value) in bag[j].items():
-                        # chi-squared test
-                        if (not apply_chi_squared) or (key in relevant_features):
-                            # append the prefices to the words to
-                            # distinguish between window-sizes
-                            word = MUSE._shift_left(
-                                key, highest, ind, self.highest_dim_bit, window_size
-                            )
-                            all_words[j][word] = value
-
-        self.clf = make_pipeline(
-            DictVectorizer(sparse=True, sort=False),
-            # StandardScaler(with_mean=True, copy=False),
-            LogisticRegression(
-                max_iter=5000,
-                solver="liblinear",
-                dual=True,
-                # class_weight="balanced",
-                penalty="l2",
-                random_state=self.random_state,
-                n_jobs=self._threads_to_use,
-            ),
+                doc_ids, keys, values = MUSE._bag_to_arrays(bag)
+
+                # chi-squared test, a single mask for the whole window
+                if apply_chi_squared:
+                    relevant = np.isin(keys, relevant_features)
+                    doc_ids = doc_ids[relevant]
+                    keys = keys[relevant]
+                    values = values[relevant]
+
+                # append the prefices to the words to
+                # distinguish between window-sizes
+                words = ((keys << highest | ind) << self.highest_dim_bit) | window_size
+                for j, word, value in zip(
+                    doc_ids.tolist(), words.tolist(), values.tolist()
+                ):
+                    all_words[j][word] = value
+
+        self.clf = LogisticRegression(
+            max_iter=5000,
+            solver="liblinear",
+            dual=True,
+            # class_weight="balanced",
+            penalty="l2",
+            random_state=self.random_state,
+            n_jobs=self._threads_to_use,
         )
 
         for words in all_words:
             if len(words) == 0:
                 words[-1] = 1
 
-        self.clf.fit(all_words, y)
+        # the sorted vocabulary gives the column of each word in the bag
+        doc_ids, words, counts = MUSE._bag_to_arrays(all_words)
+        self.vocab_, word_cols = np.unique(words, return_inverse=True)
+        bag = coo_matrix(
+            (counts, (doc_ids, word_cols)), shape=(len(all_words), self.vocab_.size)
+        ).tocsr()
+
+        self.clf.fit(bag, y)
 
         return self
 
@@ -343,15 +358,43 @@ class MUSE(BaseClassifier):
                 # the used window-length
                 highest = np.int32(self.highest_bits[ind])
                 for j in range(len(bag)):
-                    for (key, value) in bag[j].items():
-                        # append the prefices to the words to distinguish
-                        # between window-sizes
-                        word = MUSE._shift_left(
-                            key, highest, ind, self.highest_dim_bit, window_size
-                        )
-                        bag_all_words[j][word] = value
-
-        return bag_all_words
+                    keys = np.fromiter(bag[j].keys(), dtype=np.int64, count=len(bag[j]))
+
+                    # append the prefices to the words to distinguish
+                    # between window-sizes
+                    words = (
+                        (keys << highest | ind) << self.highest_dim_bit
+                    ) | window_size
+                    bag_all_words[j].update(zip(words.tolist(), bag[j].values()))
+
+        # map words to the columns of the fitted vocabulary, dropping words
+        # which were not seen (or not selected) during fit
+        doc_ids, words, counts = MUSE._bag_to_arrays(bag_all_words)
+        word_cols = np.searchsorted(self.vocab_, words)
+        known = word_cols < self.vocab_.size
+        known[known] = self.vocab_[word_cols[known]] == words[known]
+
+        return coo_matrix(
+            (counts[known], (doc_ids[known], word_cols[known])),
+            shape=(len(bag_all_words), self.vocab_.size),
+        ).tocsr()
+
+    @staticmethod
+    def _bag_to_arrays(all_words):
+        # flatten the bag-of-patterns into (doc, word, count) arrays
+        doc_ids = np.repeat(
+            np.arange(len(all_words), dtype=np.int32),
+            [len(words) for words in all_words],
+        )
+        words = np.fromiter(
+            chain.from_iterable(all_words), dtype=np.int64, count=doc_ids.size
+        )
+        counts = np.fromiter(
+            chain.from_iterable(doc.values() for doc in all_words),
+            dtype=np.int32,
+            count=doc_ids.size,
+        )
+        return doc_ids, words, counts
 
     def _add_first_order_differences(self, X):
         X_copy = X.copy()
@@ -8,15 +8,17 @@ __author__ = ["patrickzib", "Arik Ermshaus"]
 __all__ = ["WEASEL"]
 
 import math
+from itertools import chain
 
 import numpy as np
 from joblib import Parallel, delayed
 from numba import njit
-from sklearn.feature_extraction import DictVectorizer
+from scipy.sparse import coo_matrix
 from sklearn.feature_selection import chi2
 from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import make_pipeline
-from sklearn.utils import check_random_state
+from sklearn.preprocessing import MaxAbsScaler
+from sklearn.utils.validation import check_memory
 
 from sktime.classification.base import BaseClassifier
 from sktime.transformations.panel.dictionary_based import SFA
@@ -47,7 +49,9 @@ class WEASEL(BaseClassifier):
     one bag-of-patterns. Words from different window-lengths are
     discriminated by different prefixes.
     fit involves training a logistic regression classifier on the single
-    bag-of-patterns.
+    bag-of-patterns. The liblinear solver is used for fewer than 1000 training
+    instances, larger training sets use the saga solver on the bag scaled to
+    [-1, 1] by its maximum absolute values.
 
     predict uses the logistic regression classifier
 
@@ -72,6 +76,11 @@ class WEASEL(BaseClassifier):
         should not be performed.
     random_state: int or None, default=None
         Seed for random, integer
+    memory: None, str or object with the joblib.Memory interface, default=None
+        Used to cache the SFA transform of each window, which avoids refitting
+        the transformers for repeated fits on the same data. By default, no
+        caching is performed. If a string is given, it is the path to the
+        caching directory.
 
     Attributes
     ----------
@@ -113,6 +122,16 @@ class WEASEL(BaseClassifier):
         "classifier_type": "dictionary",
     }
 
+    # joblib backend for the per-window SFA fits and transforms. SFA mostly runs
+    # python code holding the GIL, so processes are used by default. X is passed
+    # as an argument to module-level functions, so that joblib memory maps it
+    # into the workers (by default for arrays above 1MB) rather than pickling
+    # it for every window.
+    _backend = "loky"
+
+    # number of training instances from which saga is used instead of liblinear
+    _saga_min_instances = 1000
+
     def __init__(
         self,
         anova=True,
@@ -122,6 +141,7 @@ class WEASEL(BaseClassifier):
         p_threshold=0.05,
         n_jobs=1,
         random_state=None,
+        memory=None,
     ):
 
         # currently greater values than 4 are not supported.
@@ -152,6 +172,7 @@ class WEASEL(BaseClassifier):
         self.SFA_transformers = []
         self.clf = None
         self.n_jobs = n_jobs
+        self.memory = memory
 
         super(WEASEL, self).__init__()
 
@@ -189,94 +210,102 @@ class WEASEL(BaseClassifier):
         self.window_sizes = list(range(self.min_window, self.max_window, win_inc))
         self.highest_bit = (math.ceil(math.log2(self.max_window))) + 1
 
-        def _parallel_fit(
-            window_size,
-        ):
-            rng = check_random_state(window_size)
-            all_words = [dict() for x in range(len(X))]
-            relevant_features_count = 0
-
-            # for window_size in self.window_sizes:
-            transformer = SFA(
-                word_length=rng.choice(self.word_lengths),
-                alphabet_size=self.alphabet_size,
-                window_size=window_size,
-                norm=rng.choice(self.norm_options),
-                anova=self.anova,
-                # levels=rng.choice([1, 2, 3]),
-                binning_method=self.binning_strategy,
-                bigrams=self.bigrams,
-                remove_repeat_words=False,
-                lower_bounding=False,
-                save_words=False,
+        # deterministic schedule of word lengths and norms over the windows
+        window_idx = np.arange(len(self.window_sizes))
+        word_lengths = np.asarray(self.word_lengths)[
+            window_idx % len(self.word_lengths)
+        ]
+        norms = np.asarray(self.norm_options)[window_idx % len(self.norm_options)]
+
+        # optionally cache the SFA transform of each window on disk
+        parallel_fit = check_memory(self.memory).cache(_parallel_fit)
+
+        # contiguous X is memory mapped by joblib without a copy
+        X = np.ascontiguousarray(X)
+        parallel_res = Parallel(n_jobs=self._threads_to_use, backend=self._backend)(
+            delayed(parallel_fit)(
+                X,
+                y,
+                window_size,
+                word_lengths[i],
+                norms[i],
+                self.alphabet_size,
+                self.anova,
+                self.binning_strategy,
+                self.bigrams,
+                self.highest_bit,
+                self._word_dtype(),
             )
-
-            sfa_words = transformer.fit_transform(X, y)
-
-            # self.SFA_transformers.append(transformer)
-            bag = sfa_words[0]
-            apply_chi_squared = self.p_threshold < 1
-
-            # chi-squared test to keep only relevant features
-            if apply_chi_squared:
-                vectorizer = DictVectorizer(sparse=True, dtype=np.int32, sort=False)
-                bag_vec = vectorizer.fit_transform(bag)
-
-                chi2_statistics, p = chi2(bag_vec, y)
-                relevant_features_idx = np.where(p <= self.p_threshold)[0]
-                relevant_features = set(
-                    np.array(vectorizer.feature_names_)[relevant_features_idx]
-                )
-                relevant_features_count += len(relevant_features_idx)
-
-                # merging bag-of-patterns of different window_sizes
-                # to single bag-of-patterns with prefix indicating
-                # the used window-length
-                for j in range(len(bag)):
-                    for (key, value) in bag[j].items():
-                        # chi-squared test
-                        if (not apply_chi_squared) or (key in relevant_features):
-                            # append the prefixes to the words to
-                            # distinguish between window-sizes
-                            word = WEASEL._shift_left(
-                                key, self.highest_bit, window_size
-                            )
-                            all_words[j][word] = value
-
-                return all_words, transformer, relevant_features_count
-
-        parallel_res = Parallel(n_jobs=self._threads_to_use)(
-            delayed(_parallel_fit)(window_size) for window_size in self.window_sizes
+            for i, window_size in enumerate(self.window_sizes)
         )  # , verbose=self.verbose
 
-        relevant_features_count = 0
-        all_words = [dict() for x in range(len(X))]
+        doc_ids = []
+        words = []
+        counts = []
 
-        for sfa_words, transformer, rel_features_count in parallel_res:
-            transformer.n_jobs = self._threads_to_use
+        for window_doc_ids, window_words, window_counts, transformer in parallel_res:
             self.SFA_transformers.append(transformer)
-            relevant_features_count += rel_features_count
-
-            for idx, bag in enumerate(sfa_words):
-                for word, count in bag.items():
-                    all_words[idx][word] = count
-
-        self.clf = make_pipeline(
-            DictVectorizer(sparse=True, sort=False),
-            # StandardScaler(copy=False),
-            LogisticRegression(
-                max_iter=5000,
-                solver="liblinear",
-                dual=True,
-                # class_weight="balanced",
-                penalty="l2",
-                random_state=self.random_state,
-                n_jobs=self._threads_to_use,
-            ),
-        )
 
-        # print("Size of dict", relevant_features_count)
-        self.clf.fit(all_words, y)
+            doc_ids.append(window_doc_ids)
+            words.append(window_words)
+            counts.append(window_counts)
+
+        doc_ids = np.concatenate(doc_ids)
+        # single precision halves the memory traffic of chi2 and the classifier
+        counts = np.concatenate(counts).astype(np.float32)
+
+        # words are unique across windows due to the window-size prefix, so
+        # the sorted vocabulary directly gives the column of each word
+        self.vocab_, word_cols = np.unique(np.concatenate(words), return_inverse=True)
+        bag = coo_matrix(
+            (counts, (doc_ids, word_cols)), shape=(len(X), self.vocab_.size)
+        ).tocsr()
+
+        # chi-squared test to keep only relevant features, the test is
+        # independent per word so a single pass over all windows suffices
+        if self.p_threshold < 1:
+            chi2_statistics, p = chi2(bag, y)
+            relevant_features = p <= self.p_threshold
+
+            # drop irrelevant words from the (doc, word, count) arrays and
+            # renumber the columns of the remaining ones
+            relevant = relevant_features[word_cols]
+            word_cols = (np.cumsum(relevant_features) - 1)[word_cols[relevant]]
+            self.vocab_ = self.vocab_[relevant_features]
+            bag = coo_matrix(
+                (counts[relevant], (doc_ids[relevant], word_cols)),
+                shape=(len(X), self.vocab_.size),
+            ).tocsr()
+
+        # liblinear is fast for small problems, but is single-threaded and
+        # one-vs-rest only. saga scales better to large sparse bags. Both are
+        # wrapped in a pipeline, so that clf does not depend on the data size.
+        if self.n_instances < self._saga_min_instances:
+            self.clf = make_pipeline(
+                LogisticRegression(
+                    max_iter=5000,
+                    solver="liblinear",
+                    dual=True,
+                    # class_weight="balanced",
+                    penalty="l2",
+                    random_state=self.random_state,
+                    n_jobs=self._threads_to_use,
+                )
+            )
+        else:
+            self.clf = make_pipeline(
+                # word counts vary in magnitude, scaling aids saga convergence
+                MaxAbsScaler(),
+                LogisticRegression(
+                    max_iter=5000,
+                    solver="saga",
+                    tol=1e-3,
+                    penalty="l2",
+                    random_state=self.random_state,
+                ),
+            )
+
+        self.clf.fit(bag, y)
 
         return self
 
@@ -313,25 +342,63 @@ class WEASEL(BaseClassifier):
         return self.clf.predict_proba(bag)
 
     def _transform_words(self, X):
-        bag_all_words = [dict() for _ in range(len(X))]
-        for transformer in self.SFA_transformers:
-            # SFA transform
-            sfa_words = transformer.transform(X)
-            bag = sfa_words[0]
-
-            # merging bag-of-patterns of different window_sizes
-            # to single bag-of-patterns with prefix indicating
-            # the used window-length
-            for j in range(len(bag)):
-                for (key, value) in bag[j].items():
-                    # append the prefices to the words to distinguish
-                    # between window-sizes
-                    word = WEASEL._shift_left(
-                        key, self.highest_bit, transformer.window_size
-                    )
-                    bag_all_words[j][word] = value
-
-        return bag_all_words
+        X = np.ascontiguousarray(X)
+        parallel_res = Parallel(n_jobs=self._threads_to_use, backend=self._backend)(
+            delayed(_transform_window)(
+                transformer, X, self.highest_bit, self._word_dtype()
+            )
+            for transformer in self.SFA_transformers
+        )
+        doc_ids, words, counts = zip(*parallel_res)
+
+        doc_ids = np.concatenate(doc_ids)
+        words = np.concatenate(words)
+        counts = np.concatenate(counts).astype(np.float32)
+
+        # map words to the columns of the fitted vocabulary, dropping words
+        # which were not seen (or not selected) during fit
+        word_cols = np.searchsorted(self.vocab_, words)
+        known = word_cols < self.vocab_.size
+        known[known] = self.vocab_[word_cols[known]] == words[known]
+
+        return coo_matrix(
+            (counts[known], (doc_ids[known], word_cols[known])),
+            shape=(len(X), self.vocab_.size),
+        ).tocsr()
+
+    @staticmethod
+    def _unpack_bag(bag, highest_bit, window_size, word_dtype):
+        # merging bag-of-patterns of different window_sizes
+        # to single bag-of-patterns with prefix indicating
+        # the used window-length, stored as (doc, word, count) arrays. The
+        # python dicts of SFA are drained straight into preallocated arrays
+        doc_ids = np.repeat(
+            np.arange(len(bag), dtype=np.int32), [len(doc) for doc in bag]
+        )
+        keys = np.fromiter(chain.from_iterable(bag), dtype=np.int64, count=doc_ids.size)
+        counts = np.fromiter(
+            chain.from_iterable(doc.values() for doc in bag),
+            dtype=np.int64,
+            count=doc_ids.size,
+        )
+
+        # append the prefixes to the words to distinguish between
+        # window-sizes, a single vectorised shift for the whole window
+        words = (keys << highest_bit) | window_size
+        return (
+            doc_ids,
+            words.astype(word_dtype),
+            np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16),
+        )
+
+    def _word_dtype(self):
+        # narrowest integer type which can hold all words including their
+        # window-size prefix
+        letter_bits = math.ceil(math.log2(self.alphabet_size))
+        word_bits = max(self.word_lengths) * letter_bits
+        if self.bigrams:
+            word_bits *= 2
+        return np.int32 if word_bits + self.highest_bit < 32 else np.int64
 
     def _compute_window_inc(self):
         win_inc = self.window_inc
@@ -367,3 +434,50 @@ class WEASEL(BaseClassifier):
             `create_test_instance` uses the first (or only) dictionary in `params`.
         """
         return {"window_inc": 4}
+
+
+# cached by WEASEL's memory, note that the cache key covers the code of this
+# function only, not of WEASEL._unpack_bag which it calls. Clear the cache
+# after changing the latter.
+def _parallel_fit(
+    X,
+    y,
+    window_size,
+    word_length,
+    norm,
+    alphabet_size,
+    anova,
+    binning_strategy,
+    bigrams,
+    highest_bit,
+    word_dtype,
+):
+    transformer = SFA(
+        word_length=word_length,
+        alphabet_size=alphabet_size,
+        window_size=window_size,
+        norm=norm,
+        anova=anova,
+        # levels=rng.choice([1, 2, 3]),
+        binning_method=binning_strategy,
+        bigrams=bigrams,
+        remove_repeat_words=False,
+        lower_bounding=False,
+        save_words=False,
+    )
+
+    sfa_words = transformer.fit_transform(X, y)
+    bag = sfa_words[0]
+
+    return (
+        *WEASEL._unpack_bag(bag, highest_bit, window_size, word_dtype),
+        transformer,
+    )
+
+
+def _transform_window(transformer, X, highest_bit, word_dtype):
+    # SFA transform, only the transformer of the window is sent to the worker
+    sfa_words = transformer.transform(X)
+    return WEASEL._unpack_bag(
+        sfa_words[0], highest_bit, transformer.window_size, word_dtype
+    )
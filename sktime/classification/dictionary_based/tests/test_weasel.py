@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""WEASEL test code."""
+import numpy as np
+
+from sktime.classification.dictionary_based._weasel import WEASEL
+from sktime.datasets import load_unit_test
+from sktime.transformations.panel.dictionary_based import SFA
+
+
+def test_weasel_without_feature_selection():
+    """Test of WEASEL with the chi-squared test disabled on unit test data."""
+    # load unit test data
+    X_train, y_train = load_unit_test(split="train")
+    X_test, _ = load_unit_test(split="test")
+
+    # train WEASEL keeping all words
+    weasel = WEASEL(window_inc=4, p_threshold=1, random_state=0)
+    weasel.fit(X_train, y_train)
+
+    # all distinct words of the windows' bags are kept, none are filtered
+    n_words = sum(
+        len(set().union(*transformer.transform(X_train)[0]))
+        for transformer in weasel.SFA_transformers
+    )
+    assert weasel.vocab_.size == n_words
+
+    # whereas the chi-squared test drops some of them
+    selected = WEASEL(window_inc=4, random_state=0).fit(X_train, y_train)
+    assert selected.vocab_.size < n_words
+
+    probas = weasel.predict_proba(X_test.iloc[:10])
+    assert probas.shape == (10, 2)
+    np.testing.assert_almost_equal(probas.sum(axis=1), 1, decimal=4)
+
+
+def test_weasel_large_training_set():
+    """Test of WEASEL with the saga solver used for larger training sets."""
+    # two classes of noisy sine waves with different frequencies
+    rng = np.random.RandomState(0)
+    n_instances, series_length = 1000, 24
+    y = np.repeat(["a", "b"], n_instances // 2)
+    t = np.linspace(0, 2 * np.pi, series_length)
+    X = rng.normal(scale=0.5, size=(n_instances, 1, series_length))
+    X += np.where((y == "a")[:, None], np.sin(t), np.sin(3 * t))[:, None, :]
+
+    # train WEASEL
+    weasel = WEASEL(random_state=0)
+    weasel.fit(X, y)
+
+    # the logistic regression converged on the scaled bag
+    clf = weasel.clf[-1]
+    assert clf.solver == "saga"
+    assert clf.n_iter_.max() < clf.max_iter
+
+    probas = weasel.predict_proba(X[:10])
+    assert probas.shape == (10, 2)
+    np.testing.assert_almost_equal(probas.sum(axis=1), 1, decimal=4)
+    assert weasel.score(X, y) > 0.9
+
+
+def test_weasel_memory(tmp_path, monkeypatch):
+    """Test of WEASEL caching the SFA window fits on unit test data."""
+    # load unit test data
+    X_train, y_train = load_unit_test(split="train")
+    X_test, _ = load_unit_test(split="test")
+
+    # train WEASEL, filling the cache
+    weasel = WEASEL(window_inc=4, random_state=0, memory=str(tmp_path))
+    weasel.fit(X_train, y_train)
+    expected = weasel.predict_proba(X_test)
+
+    # refit, all window fits must be served from the cache
+    def _fail(*args, **kwargs):
+        raise AssertionError("SFA was refitted despite the cache")
+
+    monkeypatch.setattr(SFA, "fit_transform", _fail)
+    weasel.fit(X_train, y_train)
+
+    np.testing.assert_array_equal(weasel.predict_proba(X_test), expected)
@@ -54,16 +54,16 @@ unit_test_proba["TemporalDictionaryEnsemble"] = np.array(
 )
 unit_test_proba["WEASEL"] = np.array(
     [
-        [0.2377, 0.7623],
-        [0.6074, 0.3926],
-        [0.0888, 0.9112],
-        [0.9386, 0.0614],
-        [0.926, 0.074],
-        [0.9219, 0.0781],
-        [0.2119, 0.7881],
-        [0.1245, 0.8755],
-        [0.8867, 0.1133],
-        [0.9241, 0.0759],
+        [0.2868, 0.7132],
+        [0.7667, 0.2333],
+        [0.08, 0.92],
+        [0.9411, 0.0589],
+        [0.9456, 0.0544],
+        [0.9522, 0.0478],
+        [0.1977, 0.8023],
+        [0.1455, 0.8545],
+        [0.7897, 0.2103],
+        [0.9357, 0.0643],
     ]
 )
 unit_test_proba["ElasticEnsemble"] = np.array(